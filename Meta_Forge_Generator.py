@@ -6,52 +6,258 @@ Created: 2025-11-04
 License: GNU Affero GPL v3 with Constitutional Commons Protection
 """
 
+import collections
+import contextlib
+import functools
+import itertools
 import json
+import logging
+import os
+import stat
+import sys
+import tempfile
+import types
+import warnings
 import yaml
-from typing import Dict, Any
-from dataclasses import dataclass
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Any, List, Mapping, NamedTuple, Optional, Tuple
+from dataclasses import dataclass, field
 
-@dataclass
+# Prefer the LibYAML-backed loader; the pure-Python parser is much slower
+try:
+    from yaml import CSafeLoader as _YamlLoader
+except ImportError:
+    from yaml import SafeLoader as _YamlLoader
+    warnings.warn("LibYAML not available, falling back to pure-Python YAML loader")
+
+_log = logging.getLogger(__name__)
+
+# Serialize one record as a newline-terminated UTF-8 JSON line (NDJSON)
+try:
+    import orjson
+
+    def _dumps(obj: Any) -> bytes:
+        return orjson.dumps(obj, option=orjson.OPT_APPEND_NEWLINE)
+except ImportError:
+    def _dumps(obj: Any) -> bytes:
+        # Compact separators match orjson's output byte for byte
+        return (json.dumps(obj, ensure_ascii=False, separators=(',', ':')) + "\n").encode()
+
+# Optional on-disk cache of the parsed kernel, stored next to kernel.yml
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+_PARSE_CACHE_SUFFIX = '.cache'
+
+def _read_parse_cache(path: str, mtime_ns: int, size: int) -> Optional[Dict[str, Any]]:
+    """Return the cached kernel if the sidecar matches the source file, else None"""
+    try:
+        with open(path + _PARSE_CACHE_SUFFIX, 'rb') as f:
+            cached_mtime_ns, cached_size, kernel = msgpack.unpackb(
+                f.read(), raw=False, strict_map_key=False)
+    except (OSError, ValueError, TypeError):
+        # Missing, unreadable or corrupt sidecar
+        return None
+    if (cached_mtime_ns, cached_size) != (mtime_ns, size):
+        return None
+    return kernel
+
+def _write_parse_cache(path: str, mtime_ns: int, size: int, kernel: Dict[str, Any]) -> None:
+    """Atomically replace the sidecar; failures only cost the next startup a re-parse"""
+    try:
+        payload = msgpack.packb([mtime_ns, size, kernel])
+    except Exception:
+        # Values msgpack cannot encode (YAML dates, integers beyond 64 bits, ...)
+        return
+    tmp_path = None
+    try:
+        # Named '<kernel>.<random>.yml.cache' so a leftover after a crash stays ignored
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path),
+                                        prefix=os.path.basename(path) + '.',
+                                        suffix=os.path.splitext(path)[1] + _PARSE_CACHE_SUFFIX)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(payload)
+        # mkstemp creates 0600; readable by whoever can read the kernel itself
+        os.chmod(tmp_path, stat.S_IMODE(os.stat(path).st_mode) & 0o666)
+        os.replace(tmp_path, path + _PARSE_CACHE_SUFFIX)
+    except OSError:
+        # Read-only directory or full disk
+        if tmp_path is not None:
+            with contextlib.suppress(OSError):
+                os.unlink(tmp_path)
+
+@functools.lru_cache(maxsize=32)
+def _load_kernel_cached(path: str, mtime_ns: int, size: int) -> Dict[str, Any]:
+    """Load a parsed kernel; mtime/size are cache keys so edits invalidate the entry"""
+    if msgpack is None:
+        return _parse_kernel(path)
+    kernel = _read_parse_cache(path, mtime_ns, size)
+    if kernel is None:
+        kernel = _parse_kernel(path)
+        _write_parse_cache(path, mtime_ns, size, kernel)
+    return kernel
+
+def _parse_kernel(path: str) -> Dict[str, Any]:
+    """Parse a kernel file from YAML"""
+    # The loader already reads the binary file in chunks, and a named file
+    # object keeps the path in YAML error marks
+    with open(path, 'rb') as f:
+        return yaml.load(f, Loader=_YamlLoader)
+
+# Header fields (constitutional_version, ...) sit at the top of kernel.yml
+_KERNEL_HEADER_LINES = 32
+
+@functools.lru_cache(maxsize=32)
+def _load_kernel_header(path: str, mtime_ns: int, size: int) -> Dict[str, Any]:
+    """Parse only the leading lines of a kernel file to read its header fields"""
+    with open(path, 'rb') as f:
+        head = b''.join(itertools.islice(f, _KERNEL_HEADER_LINES))
+        truncated = bool(f.read(1))
+    try:
+        header = yaml.load(head, Loader=_YamlLoader)
+        if truncated:
+            # The last top-level key may continue past the slice; only keys
+            # followed by another top-level key are known to be complete
+            header.popitem()
+        header['constitutional_version']
+    except (yaml.YAMLError, KeyError, TypeError, AttributeError):
+        # Slice cut through a node or holds no version; fall back to the full document
+        header = _load_kernel_cached(path, mtime_ns, size)
+    if not isinstance(header, dict):
+        raise ConstitutionalViolation(f"Kernel {path} must be a YAML mapping")
+    return header
+
+# Top-level sections every domain specification must provide
+_REQUIRED_FIELDS = frozenset(('pattern', 'context', 'constraints'))
+
+# Shared read-only stand-ins for absent optional spec sections
+_EMPTY: Tuple[str, ...] = ()
+_EMPTY_MAPPING = types.MappingProxyType({})
+
+def _intern(value: Any) -> Any:
+    """Intern ingested strings so later comparisons and lookups hit the identity fast path"""
+    return sys.intern(value) if type(value) is str else value
+
+_HW_RASPBERRY_PI = sys.intern('raspberry_pi')
+_HW_DESKTOP = sys.intern('desktop')
+_HW_DEDICATED = sys.intern('dedicated')
+_HW_CLOUD = sys.intern('cloud')
+_CAPACITY_ADVANCED = sys.intern('advanced')
+
+_ARCH_TWO_NODE = sys.intern('two_node')
+_ARCH_DECOUPLED_DAIN = sys.intern('decoupled_dain')
+_ARCH_DECOUPLED_NON_DAIN = sys.intern('decoupled_non_dain')
+
+_DAIN_HARDWARE_WARNING = "DAIN generation disabled: Requires dedicated hardware for constitutional compliance"
+_DAIN_CAPACITY_WARNING = "DAIN generation disabled: Requires advanced technical capacity"
+
+_HARDWARE_PROFILES = (_HW_RASPBERRY_PI, _HW_DESKTOP, _HW_DEDICATED, _HW_CLOUD)
+# Two-node limits leave 1G/2G for the OS on 4GB/8GB systems; DAIN limits size the AI node
+_MEMORY_LIMITS = {_HW_RASPBERRY_PI: '3G', _HW_DESKTOP: '6G', _HW_DEDICATED: '4G', _HW_CLOUD: '8G'}
+# Unknown hardware profiles get the conservative default
+_DEFAULT_ARCHITECTURE = (_ARCH_TWO_NODE, None, False, None)
+
+def _select_architecture(hardware: str, advanced_capacity: bool, wants_ai: bool) -> tuple:
+    """
+    Hardware-aware architecture selection (Article 0 enforcement)
+    Returns (architecture, memory_limit, enable_dain, warning)
+    """
+    match (hardware, advanced_capacity, wants_ai):
+        case ('dedicated' | 'cloud', True, True):
+            return (_ARCH_DECOUPLED_DAIN, _MEMORY_LIMITS[hardware], True, None)
+        case ('dedicated' | 'cloud', _, _):
+            warning = _DAIN_CAPACITY_WARNING if wants_ai else None
+            return (_ARCH_DECOUPLED_NON_DAIN, None, False, warning)
+        case ('raspberry_pi' | 'desktop', _, _):
+            warning = _DAIN_HARDWARE_WARNING if wants_ai else None
+            return (_ARCH_TWO_NODE, _MEMORY_LIMITS[hardware], False, warning)
+        case _:
+            return _DEFAULT_ARCHITECTURE
+
+# The input space is finite, so every decision is made once at import and
+# forge generation only pays for a single hashed lookup
+# (hardware, advanced_capacity, wants_ai) -> (architecture, memory_limit, enable_dain, warning)
+_ARCHITECTURE_TABLE = {
+    key: _select_architecture(*key)
+    for key in itertools.product(_HARDWARE_PROFILES, (False, True), (False, True))
+}
+
+# Forge file layout, appended to the domain name
+_BASE_FILE_SUFFIXES = (
+    "/kernel.yml -> Constitutional kernel (git submodule)",
+    "/domain_config.json -> Domain-specific configuration",
+    "/docker-compose.yml -> Deployment configuration",
+    "/constitutional_linter.py -> Rule enforcement system",
+    "/README.md -> Usage instructions",
+)
+_DAIN_FILE_SUFFIXES = (
+    "/docker-compose.dain.yml -> AI node deployment",
+    "/dain_c_agent.py -> Constitutional audit AI",
+)
+
+@dataclass(slots=True)
 class ForgeGenerationParameters:
     """Constitutional parameters for forge generation"""
     architecture: str
-    memory_limit: str
-    enable_dain_generation: bool
-    constitutional_requirements: list
-    generation_warnings: list
+    memory_limit: Optional[str] = None
+    enable_dain_generation: bool = False
+    constitutional_requirements: Tuple[str, ...] = _EMPTY
+    generation_warnings: List[str] = field(default_factory=list)
+
+class LogEntry(NamedTuple):
+    """Immutable record of one forge generation"""
+    domain: str
+    architecture: str
+    dain_enabled: bool
+    warnings: Tuple[str, ...]
 
 class ConstitutionalKernel:
     """Loads and enforces the constitutional kernel rules"""
     
     def __init__(self, kernel_path: str = "kernel.yml"):
         self.kernel_path = kernel_path
-        self.rules = self._load_kernel()
+        self._rules = None
+        self.header = self._load_kernel(_load_kernel_header)
+        _log.info("✓ Loaded Constitutional Kernel v%s", self.header.get('constitutional_version', 'unknown'))
+        
+    @property
+    def rules(self) -> Dict[str, Any]:
+        """Full kernel document, parsed on first use"""
+        if self._rules is None:
+            self._rules = self._load_kernel(_load_kernel_cached)
+        return self._rules
+    
+    @rules.setter
+    def rules(self, rules: Dict[str, Any]) -> None:
+        """Replace the kernel document, e.g. to inject rules in tests"""
+        self._rules = rules
         
-    def _load_kernel(self) -> Dict[str, Any]:
+    def _load_kernel(self, loader) -> Dict[str, Any]:
         """Load the constitutional kernel from YAML"""
+        path = os.path.abspath(self.kernel_path)
         try:
-            with open(self.kernel_path, 'r') as f:
-                kernel = yaml.safe_load(f)
-                print(f"✓ Loaded Constitutional Kernel v{kernel.get('constitutional_version', 'unknown')}")
-                return kernel
-        except Exception as e:
-            raise Exception(f"Constitutional violation: Cannot load kernel - {e}")
+            st = os.stat(path)
+            # Shared across instances; the kernel rules are treated as read-only
+            return loader(path, st.st_mtime_ns, st.st_size)
+        except (OSError, yaml.YAMLError) as e:
+            raise ConstitutionalViolation(f"Cannot load kernel {path} - {e}") from e
     
     def validate_domain_spec(self, domain_spec: Dict[str, Any]) -> bool:
         """Validate domain specification against constitutional rules"""
-        print("🔍 Validating domain specification against constitutional kernel...")
+        _log.info("🔍 Validating domain specification against constitutional kernel...")
+        _ = self.rules  # Full kernel parse is deferred until first validation
         
         # Check for required fields
-        required_fields = ['pattern', 'context', 'constraints']
-        for field in required_fields:
-            if field not in domain_spec:
-                raise ConstitutionalViolation(f"Missing required field: {field}")
+        missing = _REQUIRED_FIELDS.difference(domain_spec)
+        if missing:
+            raise ConstitutionalViolation(f"Missing required fields: {sorted(missing)}")
         
         # Enforce hardware awareness (Article 0)
-        if 'hardware' not in domain_spec.get('constraints', {}):
+        if 'hardware' not in domain_spec['constraints']:
             raise ConstitutionalViolation("Hardware constraints required (Article 0)")
             
-        print("✓ Domain specification constitutionally compliant")
+        _log.info("✓ Domain specification constitutionally compliant")
         return True
 
 class MetaForgeGenerator:
@@ -60,85 +266,121 @@ class MetaForgeGenerator:
     while enforcing constitutional constraints.
     """
     
+    __slots__ = ('kernel', 'generation_log')
+    
     def __init__(self, kernel: ConstitutionalKernel):
         self.kernel = kernel
-        self.generation_log = []
+        # Append-only; deque appends never trigger a resize-and-copy
+        self.generation_log = collections.deque()
         
     def process_diagnostic_input(self, diagnostic_input: Dict[str, Any]) -> ForgeGenerationParameters:
         """
         Process domain specification and generate appropriate architecture
         Implements Hardware-Aware Architecture Selection from Design Forge Generator
         """
-        print("🎯 Processing domain specification for forge generation...")
+        _log.info("🎯 Processing domain specification for forge generation...")
         
         # Extract constraints
-        hardware = diagnostic_input['constraints']['hardware']
-        tech_capacity = diagnostic_input['constraints']['technical_capacity']
-        wants_ai = diagnostic_input.get('customization_requests', {}).get('wants_ai_nodes', False)
+        constraints = diagnostic_input['constraints']
+        hardware = _intern(constraints['hardware'])
+        tech_capacity = _intern(constraints['technical_capacity'])
+        customization = diagnostic_input.get('customization_requests') or _EMPTY_MAPPING
+        wants_ai = customization.get('wants_ai_nodes', False)
+        domain = _intern(diagnostic_input['context']['domain'])
+        
+        key = (hardware, tech_capacity == _CAPACITY_ADVANCED, bool(wants_ai))
+        architecture, memory_limit, enable_dain, warning = _ARCHITECTURE_TABLE.get(key, _DEFAULT_ARCHITECTURE)
+        
+        # Read-only downstream, so snapshot as a tuple rather than aliasing the caller's list
+        requirements = diagnostic_input.get('constitutional_requirements')
+        if not requirements:
+            requirements = _EMPTY
+        elif isinstance(requirements, str):
+            # A single requirement given as a string, not a sequence of characters
+            requirements = (requirements,)
+        else:
+            requirements = tuple(requirements)
         
-        # Initialize parameters
         params = ForgeGenerationParameters(
-            architecture='two_node',  # Default conservative option
-            memory_limit=None,
-            enable_dain_generation=False,
-            constitutional_requirements=diagnostic_input.get('constitutional_requirements', []),
-            generation_warnings=[]
+            architecture=architecture,
+            memory_limit=memory_limit,
+            enable_dain_generation=enable_dain,
+            constitutional_requirements=requirements,
+            generation_warnings=[warning] if warning else []
         )
         
-        # Hardware-aware architecture selection (Article 0 enforcement)
-        if hardware in ['raspberry_pi', 'desktop']:
-            params.architecture = 'two_node'
-            params.memory_limit = self._calculate_memory_limit(hardware)
-            if wants_ai:
-                params.generation_warnings.append(
-                    "DAIN generation disabled: Requires dedicated hardware for constitutional compliance"
-                )
-                
-        elif hardware in ['dedicated', 'cloud'] and tech_capacity == 'advanced' and wants_ai:
-            params.architecture = 'decoupled_dain'
-            params.enable_dain_generation = True
-            params.memory_limit = '4G' if hardware == 'dedicated' else '8G'
-            
-        elif hardware in ['dedicated', 'cloud']:
-            params.architecture = 'decoupled_non_dain'
-            if wants_ai:
-                params.generation_warnings.append(
-                    "DAIN generation disabled: Requires advanced technical capacity"
-                )
-        
-        self.generation_log.append({
-            'domain': diagnostic_input['context']['domain'],
-            'architecture': params.architecture,
-            'dain_enabled': params.enable_dain_generation,
-            'warnings': params.generation_warnings
-        })
-        
+        self._record_generation(domain, params)
         return params
     
-    def _calculate_memory_limit(self, hardware_profile: str) -> str:
-        """Calculate safe memory limits (Article 0 viability enforcement)"""
-        limits = {
-            'raspberry_pi': '3G',  # Leave 1G for OS on 4GB system
-            'desktop': '6G',       # Leave 2G for OS on 8GB system  
-        }
-        return limits.get(hardware_profile, '1G')
+    def _record_generation(self, domain: str, params: ForgeGenerationParameters) -> None:
+        """Append one forge generation to the log"""
+        self.generation_log.append(LogEntry(
+            domain,
+            params.architecture,
+            params.enable_dain_generation,
+            tuple(params.generation_warnings)
+        ))
     
-    def generate_forge(self, domain_spec: Dict[str, Any]) -> Dict[str, Any]:
+    def write_generation_log(self, stream=None) -> None:
+        """Write the generation log as newline-delimited JSON (stdout by default)"""
+        # orjson does not serialize NamedTuples, and keyed objects read better anyway
+        payload = b''.join(_dumps(entry._asdict()) for entry in self.generation_log)
+        if stream is None:
+            stream = getattr(sys.stdout, 'buffer', None)
+            if stream is None:
+                # stdout replaced by a text-only stream (StringIO, notebooks)
+                sys.stdout.write(payload.decode())
+                return
+        stream.write(payload)
+    
+    def generate_forge(self, domain_spec, spec: Optional[Mapping[str, Any]] = None) -> Dict[str, Any]:
         """
         Generate a complete, constitutionally-compliant forge for a domain
         Returns the forge specification and all generated files
+        
+        domain_spec is either a raw domain specification mapping, which is validated
+        and processed, or already-validated ForgeGenerationParameters (e.g. a sub-forge
+        inheriting its parent's validation); parameters require the domain
+        specification they apply to as the second argument: generate_forge(params, spec)
         """
-        print(f"🏭 Generating forge for domain: {domain_spec['context']['domain']}")
+        if isinstance(domain_spec, ForgeGenerationParameters):
+            if spec is None:
+                raise TypeError("generate_forge(params, spec) requires the domain specification as its second argument")
+            return self._generate_forge_from_params(domain_spec, spec)
+        if isinstance(domain_spec, Mapping):
+            if spec is not None:
+                raise TypeError("generate_forge(domain_spec) takes no second argument for a raw specification")
+            return self._generate_forge_from_spec(domain_spec)
+        raise TypeError(f"Unsupported forge specification type: {type(domain_spec).__name__}")
+    
+    def _generate_forge_from_spec(self, domain_spec: Dict[str, Any]) -> Dict[str, Any]:
+        """Validate and process a raw domain specification, then generate its forge"""
+        domain = _intern(domain_spec['context']['domain'])
+        _log.info("🏭 Generating forge for domain: %s", domain)
         
         # Constitutional validation
         self.kernel.validate_domain_spec(domain_spec)
         
         # Process domain specification
         params = self.process_diagnostic_input(domain_spec)
+        return self._assemble_forge(domain, domain_spec, params)
+    
+    def _generate_forge_from_params(self, params: ForgeGenerationParameters, domain_spec: Mapping[str, Any]) -> Dict[str, Any]:
+        """
+        Generate a forge from already-validated parameters, e.g. a sub-forge
+        inheriting its parent's validation; skips validation and processing
+        """
+        domain = _intern(domain_spec['context']['domain'])
+        _log.info("🏭 Generating forge for domain: %s (pre-validated parameters)", domain)
         
+        self._record_generation(domain, params)
+        return self._assemble_forge(domain, domain_spec, params)
+    
+    def _assemble_forge(self, domain: str, domain_spec: Dict[str, Any], params: ForgeGenerationParameters) -> Dict[str, Any]:
+        """Build the forge specification from processed parameters"""
         # Generate forge specification
         forge_spec = {
-            'domain': domain_spec['context']['domain'],
+            'domain': domain,
             'generated_date': '2024-01-15',
             'architecture': params.architecture,
             'constitutional_compliance': 'verified',
@@ -147,33 +389,56 @@ class MetaForgeGenerator:
             'warnings': params.generation_warnings
         }
         
-        print(f"✅ Successfully generated forge for {domain_spec['context']['domain']}")
+        _log.info("✅ Successfully generated forge for %s", domain)
         return forge_spec
     
+    def generate_forges_batch(self, domain_specs: List[Dict[str, Any]], max_workers: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Generate forges for independent domain specifications in parallel
+        Workers rebuild the kernel from its path; results and log entries keep input order
+        """
+        if not domain_specs:
+            return []
+        
+        workers = max_workers or os.cpu_count() or 1
+        chunksize = max(1, len(domain_specs) // (4 * workers))
+        generate_one = functools.partial(_generate_forge_worker, os.path.abspath(self.kernel.kernel_path))
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            results = list(pool.map(generate_one, domain_specs, chunksize=chunksize))
+        
+        self.generation_log.extend(entry for _, entry in results)
+        return [forge_spec for forge_spec, _ in results]
+    
     def _generate_forge_files(self, domain_spec: Dict[str, Any], params: ForgeGenerationParameters) -> list:
         """Generate the actual file structure for the forge"""
         domain_name = domain_spec['context']['domain']
         
-        files = [
-            f"{domain_name}/kernel.yml -> Constitutional kernel (git submodule)",
-            f"{domain_name}/domain_config.json -> Domain-specific configuration",
-            f"{domain_name}/docker-compose.yml -> Deployment configuration",
-            f"{domain_name}/constitutional_linter.py -> Rule enforcement system",
-            f"{domain_name}/README.md -> Usage instructions"
-        ]
-        
-        if params.architecture == 'decoupled_dain':
-            files.append(f"{domain_name}/docker-compose.dain.yml -> AI node deployment")
-            files.append(f"{domain_name}/dain_c_agent.py -> Constitutional audit AI")
+        files = [f"{domain_name}{suffix}" for suffix in _BASE_FILE_SUFFIXES]
+        
+        if params.architecture == _ARCH_DECOUPLED_DAIN:
+            files.extend(f"{domain_name}{suffix}" for suffix in _DAIN_FILE_SUFFIXES)
             
         return files
 
+@functools.lru_cache(maxsize=None)
+def _worker_generator(kernel_path: str) -> MetaForgeGenerator:
+    """One generator per worker process, so the kernel is loaded once per worker"""
+    return MetaForgeGenerator(ConstitutionalKernel(kernel_path))
+
+def _generate_forge_worker(kernel_path: str, domain_spec: Dict[str, Any]) -> Tuple[Dict[str, Any], LogEntry]:
+    """Process-pool entry point for generate_forges_batch"""
+    generator = _worker_generator(kernel_path)
+    forge_spec = generator.generate_forge(domain_spec)
+    return forge_spec, generator.generation_log.pop()
+
 class ConstitutionalViolation(Exception):
     """Exception for constitutional rule violations"""
     pass
 
 # DEMONSTRATION OF WORKING IMPLEMENTATION
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s", stream=sys.stdout)
+    
     print("=" * 60)
     print("META-FORGE GENERATOR - PRIOR ART DEMONSTRATION")
     print("Constitutional AI Governance System")